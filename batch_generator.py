@@ -0,0 +1,62 @@
+import queue
+import threading
+import time
+
+
+class BatchedSQLGenerator:
+    """
+    Coalesces SQL-generation requests arriving within a short window into one
+    LLM call, amortizing the system prompt across the batch and collapsing N
+    round-trips into one. Callers block on generate() and receive only their
+    own SQL back.
+    """
+
+    def __init__(self, generate_batch, window=0.05, max_batch=8):
+        """
+        :param generate_batch: Callable taking a list of user queries and
+            returning the list of generated SQL strings, in the same order.
+        :param window: Seconds to wait for more queries before dispatching.
+        :param max_batch: Maximum number of queries per dispatched call.
+        """
+        self.generate_batch = generate_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def generate(self, user_query):
+        """
+        Queues a query and blocks until its SQL is available.
+        :param user_query: The user's input query.
+        :return: The generated SQL for this query.
+        """
+        result = queue.Queue(maxsize=1)
+        self._queue.put((user_query, result))
+        outcome = result.get()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                sqls = self.generate_batch([user_query for user_query, _ in batch])
+                if len(sqls) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} SQL statements, got {len(sqls)}")
+                for (_, result), sql in zip(batch, sqls):
+                    result.put(sql)
+            except Exception as exc:
+                for _, result in batch:
+                    result.put(exc)
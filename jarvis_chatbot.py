@@ -1,38 +1,161 @@
 import streamlit as st
 import psycopg2
+import psycopg2.pool
 import openai
 import pandas as pd
 import configparser
+import functools
+import hashlib
+import io
+import json
 import re
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
-config = configparser.ConfigParser()
-config.read('config.ini')
-context = config['SystemContext']['context']
+import cachetools
+import pyarrow as pa
+
+try:
+    import connectorx
+except ImportError:  # optional fast path; psycopg2 fetch is used without it
+    connectorx = None
+
+try:
+    import sqlglot
+    from sqlglot import exp as sqlglot_exp
+except ImportError:  # optional; keyword blocklist is used without it
+    sqlglot = None
+
+from batch_generator import BatchedSQLGenerator
+from semantic_cache import YEAR_RE, SemanticCache, extract_slots
+
+@st.cache_resource(show_spinner=False)
+def load_context():
+    """
+    Reads and parses the system context from config.ini once per process.
+    Reruns re-execute this module, so caching here turns a file stat+parse
+    per rerun into a lookup.
+    :return: Tuple of (preamble, table DDL mapping keyed by table name, instructions).
+    """
+    cfg = configparser.ConfigParser()
+    cfg.read('config.ini')
+    section = cfg['SystemContext']
+    table_ddl = {key.split('_', 1)[1].capitalize(): section[key]
+                 for key in section if key.startswith('table_')}
+    return section['preamble'], table_ddl, section['instructions']
+
+
+preamble, table_ddl, instructions = load_context()
+
+# Full catalog context, used for the interpretation call and cache keys.
+context = '\n\n'.join([preamble] + list(table_ddl.values()) + [instructions])
+
+# One-line table summaries for the router prompt; kept tiny so the router
+# call is cheap and its static prefix caches reliably.
+table_summaries = {
+    'Orders': 'order line items with market/region/dates, sales, discounts, profit and delivery status',
+    'Product': 'product catalog with prices, categories and availability',
+    'Customer': 'customer identities, segments and purchase locations',
+    'Department': 'store departments with names and coordinates',
+    'Category': 'product category names',
+}
+
+# Part of the SQL-generation cache key so that schema/context edits invalidate
+# previously cached answers.
+context_hash = hashlib.sha1(context.encode()).hexdigest()[:8]
+
+# Table and column names mined from the schema context, used by the semantic
+# cache's lexical guard.
+schema_identifiers = set(re.findall(r'\b[A-Za-z][A-Za-z0-9]*(?:_[A-Za-z0-9]+)+\b', context))
+schema_identifiers |= {'Orders', 'Product', 'Customer', 'Department', 'Category',
+                       'Market', 'Sales', 'DateOrders'}
+
+# Known enumerated values for slot mining; years are matched by pattern.
+slot_vocabularies = {
+    'market': ['LATAM', 'USCA', 'Pacific Asia', 'Europe', 'Africa'],
+}
+
+# Client-side parameterized templates for the most common Jarvis questions.
+# Matching one of these skips the LLM entirely and lets Postgres reuse its
+# plan cache. Server-side PREPARE is deliberately avoided because the pool
+# fronts PgBouncer in transaction-pooling mode, which breaks prepared
+# statements across checkouts.
+canonical_queries = {
+    'sales_by_market': {
+        'phrases': ('sales', 'total sales', 'sales market', 'total sales market'),
+        'slots': ('market', 'year'),
+        'defaults': {},
+        'sql': "SELECT SUM(Sales) AS total_sales FROM Orders "
+               "WHERE Market = %(market)s AND EXTRACT(year FROM DateOrders) = %(year)s",
+    },
+    'top_customers_by_profit': {
+        'phrases': ('top customers by profit', 'top customers profit',
+                    'best customers by profit'),
+        'slots': (),
+        'defaults': {'limit': 10},
+        'sql': "SELECT c.Customer_Fname, c.Customer_Lname, "
+               "SUM(o.Order_Profit_Per_Order) AS total_profit "
+               "FROM Orders o JOIN Customer c ON o.Order_Customer_Id = c.Customer_Id "
+               "GROUP BY c.Customer_Id, c.Customer_Fname, c.Customer_Lname "
+               "ORDER BY total_profit DESC LIMIT %(limit)s",
+    },
+    'late_delivery_rate_by_region': {
+        'phrases': ('late delivery rate by region', 'late delivery rate region',
+                    'late delivery by region'),
+        'slots': (),
+        'defaults': {},
+        'sql': "SELECT Order_Region, AVG(Late_Delivery_Risk) AS late_delivery_rate "
+               "FROM Orders GROUP BY Order_Region ORDER BY late_delivery_rate DESC",
+    },
+}
+
+# Filler words stripped before comparing a question against the canonical
+# phrases; anything else left over means the question asks for more than the
+# template answers.
+canonical_filler_words = {'show', 'me', 'what', 'is', 'are', 'was', 'were', 'the',
+                          'please', 'give', 'tell', 'us', 'our', 'my', 'a', 'an',
+                          'in', 'for', 'during'}
+
+# One shared system message reused by every ChatCompletion call. Keeping the
+# prefix byte-identical lets OpenAI's prompt-prefix cache hit on the second
+# call of each turn instead of re-billing the full schema context.
+system_message = {"role": "system", "content": context}
+
+router_system_message = {
+    "role": "system",
+    "content": "You route retail database questions to the tables they need. Tables:\n"
+               + '\n'.join(f"- {name}: {summary}" for name, summary in table_summaries.items())
+               + '\nRespond with only a JSON list of the table names the question requires.'
+}
 
 openai_api_key = st.secrets["openai_apikey"]
 gcp_postgres_host = st.secrets["pg_host"]
+gcp_postgres_port = st.secrets.get("pg_port", 6432)  # PgBouncer (transaction pooling) in front of Postgres
 gcp_postgres_user = st.secrets["pg_user"]
 gcp_postgres_password = st.secrets["pg_password"]
 gcp_postgres_dbname = st.secrets["pg_db"]
 
 
+
 def run_user_sql(user_sql, conn):
     """
     Executes the user-entered SQL query and displays the results.
     :param user_sql: The user-entered SQL query.
     """
-    if not validate_sql_query(user_sql):
-        st.error("Disallowed SQL keywords detected. Access Denied.")
+    is_safe, detail = validate_sql_query(user_sql)
+    if not is_safe:
+        st.error(detail)
         return
 
     try:
-        cursor = conn.cursor()
-        result, df = execute_sql_query(cursor, user_sql)
+        cursor = get_cursor(conn)
+        df = execute_sql_query(cursor, user_sql)
         st.write("Results:")
-        st.dataframe(df)
+        render_results(df)
 
     except Exception as e:
-        close_db_connection(conn, cursor=None)
+        conn.rollback()
         st.error(f"An error occurred: {str(e)}")
 
 
@@ -43,83 +166,481 @@ def display_message(role, content):
     with st.chat_message(role):
         st.text(content)
 
+class JarvisConnection(psycopg2.extensions.connection):
+    """
+    Connection subclass handed to the pool so per-connection state (the
+    reusable cursor) can live on the connection object - the C-level psycopg2
+    connection has no __dict__ and rejects new attributes.
+    """
+
+    _jarvis_cursor = None
+
+
+@st.cache_resource(show_spinner=False)
 def get_db_connection():
     """
-    Establishes a connection to the database using global connection parameters.
-    :return: The database connection object.
+    Builds the shared connection pool once and reuses it across reruns and
+    sessions. Connections go through PgBouncer in transaction-pooling mode,
+    so many Streamlit sessions multiplex onto a small number of backend
+    connections instead of paying TCP+TLS+auth per rerun.
+    :return: The shared ThreadedConnectionPool object.
     """
-    return psycopg2.connect(
+    return psycopg2.pool.ThreadedConnectionPool(
+        1, 20,
         host=gcp_postgres_host,
+        port=gcp_postgres_port,
         user=gcp_postgres_user,
         password=gcp_postgres_password,
-        dbname=gcp_postgres_dbname
+        dbname=gcp_postgres_dbname,
+        connection_factory=JarvisConnection
     )
 
 
-def execute_sql_query(cursor, sql_query):
+def get_cursor(conn):
     """
-    Executes the provided SQL query and returns the results.
-    :param cursor: The database cursor object.
+    Returns the cursor bound to this pooled connection, creating it on first
+    use. Reusing one cursor per connection drops the per-query allocation and
+    closes the leak where cursors were opened on the success path but never
+    closed, which PgBouncer eventually kills as idle connections.
+    :param conn: The database connection object.
+    :return: The connection's reusable cursor.
+    """
+    cursor = conn._jarvis_cursor
+    if cursor is None or cursor.closed:
+        cursor = conn.cursor()
+        conn._jarvis_cursor = cursor
+    return cursor
+
+
+def get_postgres_uri():
+    """
+    Builds the Postgres connection URI used by the connectorx fast path.
+    :return: The connection URI string.
+    """
+    user = urllib.parse.quote_plus(gcp_postgres_user)
+    password = urllib.parse.quote_plus(gcp_postgres_password)
+    return (f"postgresql://{user}:{password}@"
+            f"{gcp_postgres_host}:{gcp_postgres_port}/{gcp_postgres_dbname}")
+
+
+def normalize_sql(sql_query):
+    """
+    Canonicalizes SQL so whitespace and casing variants share one cache entry.
+    Used only as a cache key - the original SQL is what gets executed, since
+    round-tripping identifiers through the generator would quote them and
+    defeat Postgres's lowercase folding.
+    :param sql_query: The SQL to normalize.
+    :return: The normalized SQL string.
+    """
+    if sqlglot is not None:
+        try:
+            return sqlglot.transpile(sql_query, read="postgres", write="postgres", identify=True)[0]
+        except sqlglot.errors.ParseError:
+            pass
+    return ' '.join(sql_query.split())
+
+
+# Result cache: normalized SQL -> Arrow IPC bytes. The retail tables change
+# slowly and this app has no write paths, so a 5-minute TTL is safe.
+_result_cache = cachetools.TTLCache(maxsize=512, ttl=300)
+_result_cache_lock = threading.Lock()
+
+
+def _fetch_arrow_ipc(sql_query):
+    """
+    Runs the read-only query and returns the result as Arrow IPC bytes -
+    compact to hold and cheap to deserialize on repeat hits. The cache is
+    keyed on the normalized SQL so cosmetic variants share an entry, but the
+    query executed is always the original string.
     :param sql_query: The SQL query to execute.
-    :return: A tuple containing the raw result and a DataFrame representation of the result.
+    :return: The serialized Arrow IPC stream of the result table.
     """
+    key = normalize_sql(sql_query)
+    with _result_cache_lock:
+        data = _result_cache.get(key)
+    if data is not None:
+        return data
+
+    if connectorx is not None:
+        table = connectorx.read_sql(get_postgres_uri(), sql_query, return_type="arrow2")
+    else:
+        pool = get_db_connection()
+        conn = pool.getconn()
+        try:
+            # Named server-side cursor: rows stream from the server in
+            # itersize batches instead of one giant fetch.
+            cursor = conn.cursor(name='jarvis_stream')
+            cursor.itersize = 10_000
+            try:
+                cursor.execute(sql_query)
+                batches = []
+                column_names = None
+                while True:
+                    rows = cursor.fetchmany(cursor.itersize)
+                    if column_names is None:
+                        column_names = [desc[0] for desc in cursor.description]
+                    if not rows:
+                        break
+                    batches.append(pa.Table.from_pandas(pd.DataFrame(rows, columns=column_names)))
+                if batches:
+                    # Each batch infers its own types, and an all-NULL column
+                    # in one batch infers Arrow null; permissive promotion
+                    # unifies it with the int64/string the other batches saw.
+                    table = pa.concat_tables(batches, promote_options="permissive")
+                else:
+                    table = pa.Table.from_pandas(pd.DataFrame(columns=column_names))
+            finally:
+                cursor.close()
+                conn.rollback()
+        finally:
+            pool.putconn(conn)
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    data = sink.getvalue()
+    with _result_cache_lock:
+        _result_cache[key] = data
+    return data
+
+
+def execute_sql_query(cursor, sql_query, params=None):
+    """
+    Executes the provided SQL query and returns the results. Read-only query
+    results are memoized for five minutes keyed on the normalized SQL, so
+    repeat questions skip Postgres entirely; when connectorx is available the
+    rows stream over the Postgres binary protocol straight into Arrow
+    columnar buffers instead of being materialized as Python tuples.
+    Parameterized canonical queries take the cursor path so the driver binds
+    the values, and are not memoized.
+    :param cursor: The database cursor object, used on the psycopg2 path.
+    :param sql_query: The SQL query to execute.
+    :param params: Optional mapping of bind parameters for canonical templates.
+    :return: A DataFrame of the full result.
+    """
+
+    if params is not None:
+        cursor.execute(sql_query, params)
+        rows = cursor.fetchall()
+        column_names = [desc[0] for desc in cursor.description]
+        return pd.DataFrame(rows, columns=column_names)
 
-    cursor.execute(sql_query)
-    result = cursor.fetchall()
-    column_names = [desc[0] for desc in cursor.description]
-    return result, pd.DataFrame(result, columns=column_names)
+    data = _fetch_arrow_ipc(sql_query)
+    return pa.ipc.open_stream(data).read_all().to_pandas(types_mapper=pd.ArrowDtype)
+
+
+@st.fragment
+def render_results(df):
+    """
+    Renders the result table in its own fragment, so interacting with the
+    widget rerenders just the table instead of re-running the whole script.
+    The DataFrame is Arrow-backed on the connectorx path, which makes
+    Streamlit's Arrow serialization of it essentially free.
+    :param df: The result DataFrame.
+    """
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+
+def summarize_for_llm(df):
+    """
+    Compacts a result DataFrame into a fixed-size summary for the
+    interpretation prompt, so input tokens stay O(1) in the row count.
+    :param df: The result DataFrame.
+    :return: Dict with column names, row count, a head sample, and summary statistics.
+    """
+    # Restrict describe() to numeric columns on wide tables to keep the payload small.
+    describe = df.describe(include='all') if df.shape[1] <= 20 else df.describe()
+    return {
+        'columns': list(df.columns),
+        'n_rows': len(df),
+        'head': df.head(10).to_dict('records'),
+        'describe': describe.to_dict(),
+    }
 
 
 def close_db_connection(conn, cursor=None):
     """
-    Closes the database connection and cursor if provided.
+    Closes the connection's cursor and returns the connection to the pool.
     :param conn: The database connection object.
-    :param cursor: The database cursor object. Default is None.
+    :param cursor: The database cursor object. Defaults to the connection's reusable cursor.
     """
 
-    if cursor:
+    if cursor is None and conn is not None:
+        cursor = getattr(conn, '_jarvis_cursor', None)
+    if cursor is not None and not cursor.closed:
         cursor.close()
     if conn:
-        conn.close()
+        get_db_connection().putconn(conn)
 
 
-def get_sql_from_codex(user_query):
+@st.cache_resource(show_spinner=False)
+def get_executor():
     """
-    Generates an SQL query based on the user's input using OpenAI.
+    Shared worker pool for overlapping independent I/O waits, e.g. running an
+    LLM call while a SQL query is still in flight.
+    :return: The shared ThreadPoolExecutor object.
+    """
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def generate_thinking_preamble(user_query):
+    """
+    Generates a one-line status message shown while the SQL query runs.
     :param user_query: The user's input query.
-    :return: The generated SQL query.
+    :return: The status message.
+    """
+    openai.api_key = openai_api_key
+    response = openai.ChatCompletion.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "In one short sentence, tell the user what you are looking up "
+                                          "for them. Do not attempt to answer the question."},
+            {"role": "user", "content": user_query},
+        ],
+        temperature=0.3,
+        max_tokens=30
+    )
+    return response['choices'][0]['message']['content']
+
+
+@st.cache_resource(show_spinner=False)
+def get_semantic_cache():
     """
+    Builds the shared semantic cache of (query -> SQL) pairs once per process.
+    :return: The shared SemanticCache object.
+    """
+    return SemanticCache(threshold=0.92, schema_identifiers=schema_identifiers,
+                         slot_vocabularies=slot_vocabularies)
 
-    user_query = "Generate a SQL query to " + user_query + ". Your response must not contain anything other than the query " \
-                                                           "- not even 'Sure' or other basic english responses. "
 
+def embed_query(user_query):
+    """
+    Embeds the user's query for semantic cache lookups.
+    :param user_query: The user's input query.
+    :return: The embedding vector.
+    """
+    openai.api_key = openai_api_key
+    response = openai.Embedding.create(model="text-embedding-3-small", input=user_query)
+    return response['data'][0]['embedding']
+
+
+def route_tables(user_query):
+    """
+    Picks the schema tables relevant to the user's query with a small router
+    prompt, so the SQL-generation call only ships the DDL it needs.
+    :param user_query: The user's input query.
+    :return: List of table names; falls back to the full catalog if routing fails.
+    """
     openai.api_key = openai_api_key
     response = openai.ChatCompletion.create(
-        model="gpt-4",
+        model="gpt-4o-mini",
         messages=[
-            {"role": "system", "content": context},
+            router_system_message,
             {"role": "user", "content": user_query},
         ],
+        temperature=0,
+        max_tokens=20,
+        headers={"prompt-cache-key": "jarvis-router-v1"}
+    )
+    try:
+        tables = json.loads(response['choices'][0]['message']['content'])
+    except ValueError:
+        return list(table_ddl)
+    selected = [name for name in tables if name in table_ddl]
+    return selected or list(table_ddl)
+
+
+def match_canonical_query(user_query):
+    """
+    Matches the user's question against the canonical parameterized templates.
+    Matching is near-exact: slot values and filler words are stripped from the
+    question and the remaining phrase must equal one of the template's known
+    phrasings, so questions that ask for more (comparisons, trends) fall
+    through to the LLM instead of being silently mis-answered. Questions
+    naming more than one value of a slot vocabulary never match.
+    :param user_query: The user's input query.
+    :return: Tuple of (sql, params) when a template matches, otherwise None.
+    """
+    # Ambiguous questions - two markets, two years - have no single binding.
+    if len(YEAR_RE.findall(user_query)) > 1:
+        return None
+    for values in slot_vocabularies.values():
+        present = [value for value in values
+                   if re.search(r'\b%s\b' % re.escape(value), user_query, re.IGNORECASE)]
+        if len(present) > 1:
+            return None
+
+    slots = extract_slots(user_query, slot_vocabularies)
+    top_n = re.search(r'\btop\s+(\d+)\b', user_query.lower())
+    if top_n:
+        slots['limit'] = top_n.group(1)
+
+    stripped = user_query.lower()
+    for value in slots.values():
+        stripped = re.sub(r'\b%s\b' % re.escape(str(value).lower()), ' ', stripped)
+    phrase = ' '.join(word for word in re.findall(r'[a-z0-9]+', stripped)
+                      if word not in canonical_filler_words)
+
+    for spec in canonical_queries.values():
+        if phrase in spec['phrases'] and set(spec['slots']) <= set(slots):
+            params = dict(spec['defaults'])
+            params.update({name: slots[name] for name in slots if f'%({name})s' in spec['sql']})
+            params = {name: int(value) if str(value).isdigit() else value
+                      for name, value in params.items()}
+            return spec['sql'], params
+    return None
+
+
+def generate_sql(user_query):
+    """
+    Generates SQL for one question via a routed, schema-sliced prompt.
+    :param user_query: The user's input query.
+    :return: The generated SQL query.
+    """
+
+    prompt = user_query + '. Respond with a JSON object of the form {"sql": "<query>"} ' \
+                          'containing only the SQL query - nothing else.'
+
+    # Ship only the DDL of the routed tables; the static preamble stays
+    # byte-exact so prompt-prefix caching still applies.
+    selected = route_tables(user_query)
+    sql_context = '\n\n'.join([preamble] + [table_ddl[name] for name in selected] + [instructions])
+
+    openai.api_key = openai_api_key
+    response = openai.ChatCompletion.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": sql_context},
+            {"role": "user", "content": prompt},
+        ],
         temperature=0.3,  # Lower temperature to reduce randomness
-        max_tokens=50
+        max_tokens=200,
+        response_format={"type": "json_object"},
+        headers={"prompt-cache-key": "jarvis-v1"}
     )
 
-    return response['choices'][0]['message']['content']
+    return json.loads(response['choices'][0]['message']['content'])['sql']
+
+
+def generate_sql_batch(user_queries):
+    """
+    Generates SQL for several questions in one ChatCompletion call, sharing
+    the system prompt across the batch. A batch of one keeps the routed
+    single-query path.
+    :param user_queries: List of user queries.
+    :return: List of generated SQL queries, in the same order.
+    """
+
+    if len(user_queries) == 1:
+        return [generate_sql(user_queries[0])]
+
+    prompt = 'Generate one SQL query per question below. Respond with a JSON object of the ' \
+             'form {"sql": ["<query>", ...]} with one entry per question, in order - nothing else.\n' \
+             + json.dumps(user_queries)
+
+    openai.api_key = openai_api_key
+    response = openai.ChatCompletion.create(
+        model="gpt-4o",
+        messages=[
+            system_message,
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.3,
+        max_tokens=200 * len(user_queries),
+        response_format={"type": "json_object"},
+        headers={"prompt-cache-key": "jarvis-v1"}
+    )
+
+    return json.loads(response['choices'][0]['message']['content'])['sql']
+
+
+@st.cache_resource(show_spinner=False)
+def get_sql_batcher():
+    """
+    Builds the shared request coalescer once per process.
+    :return: The shared BatchedSQLGenerator object.
+    """
+    return BatchedSQLGenerator(generate_sql_batch)
+
+
+@st.cache_data(ttl=3600, max_entries=1024, show_spinner=False)
+def get_sql_from_codex(user_query, context_hash):
+    """
+    Generates an SQL query based on the user's input using OpenAI.
+    Exact repeats are served by st.cache_data; paraphrases of earlier
+    questions are served by the semantic cache; genuinely new questions
+    go through the batcher, which coalesces concurrent sessions' requests
+    into a single LLM call.
+    :param user_query: The user's input query.
+    :param context_hash: Hash of the system context, so context changes invalidate the cache.
+    :return: The generated SQL query.
+    """
+
+    cache = get_semantic_cache()
+    embedding = embed_query(cache.strip(user_query))
+    cached_sql = cache.lookup(user_query, embedding)
+    if cached_sql is not None:
+        return cached_sql
+
+    sql_query = get_sql_batcher().generate(user_query)
+    cache.add(user_query, embedding, sql_query)
+    return sql_query
+
+
+# Fallback blocklist, compiled once at import, used when sqlglot is not
+# installed: one scan over the query with no per-call pattern build.
+disallowed_sql_re = re.compile(r'(?i)\b(?:INSERT|UPDATE|DELETE|DROP|CREATE|ALTER)\b|;|--')
+
+if sqlglot is not None:
+    disallowed_sql_nodes = tuple(
+        getattr(sqlglot_exp, name) for name in
+        ('Insert', 'Update', 'Delete', 'Drop', 'Create', 'Alter', 'AlterTable',
+         'TruncateTable', 'Grant', 'Command', 'Into', 'Lock', 'LockingProperty')
+        if hasattr(sqlglot_exp, name)
+    )
+
+
+@functools.lru_cache(maxsize=512)
+def parse_sql(sql_query):
+    """
+    Parses the SQL once per unique string; the cached statement list is
+    shared by validation and template extraction.
+    :param sql_query: The SQL to parse.
+    :return: List of sqlglot expression trees, or None when parsing fails.
+    """
+    try:
+        return sqlglot.parse(sql_query, read="postgres")
+    except sqlglot.errors.ParseError:
+        return None
 
 
 def validate_sql_query(sql_query):
     """
     Validates the SQL query to ensure it doesn't contain any potentially dangerous operations or characters.
+    When sqlglot is available the query is actually parsed and must be a
+    single SELECT with no DML/DDL anywhere in the tree, which catches
+    obfuscations a keyword blocklist misses; otherwise the blocklist is used.
     :param sql_query: The SQL query to validate.
     :return: Boolean indicating whether the query is safe, and a sanitized query or error message.
     """
 
-    disallowed_keywords = ['INSERT', 'UPDATE', 'DELETE', 'DROP', ';', '--', 'CREATE', 'ALTER']
-    for keyword in disallowed_keywords:
-        if re.search(f'\\b{keyword}\\b', sql_query, re.IGNORECASE):
-            return False, f"Disallowed SQL keyword detected. Access denied."
+    if sqlglot is None:
+        match = disallowed_sql_re.search(sql_query)
+        if match:
+            return False, f"Disallowed SQL keyword detected: {match.group()}. Access denied."
+        return True, sql_query
 
-    return True
+    statements = parse_sql(sql_query)
+    if statements is None:
+        return False, "Could not parse SQL query. Access denied."
+    if len(statements) != 1 or not isinstance(statements[0], sqlglot_exp.Select):
+        return False, "Only a single SELECT statement is allowed. Access denied."
+
+    found = statements[0].find(*disallowed_sql_nodes)
+    if found is not None:
+        return False, f"Disallowed SQL operation detected: {type(found).__name__}. Access denied."
+
+    return True, sql_query
 
 
 def call_chatbot(user_query, conn):
@@ -129,36 +650,51 @@ def call_chatbot(user_query, conn):
     """
 
     openai.api_key = openai_api_key
-    sql_query = get_sql_from_codex(user_query)  # Generate SQL
-    if not validate_sql_query(sql_query):
-        close_db_connection(conn, cursor=None)
-        raise ValueError("Keywords or characters detected that could trigger an attack")
+    canonical = match_canonical_query(user_query)
+    if canonical is not None:
+        sql_query, params = canonical  # Known question shape: skip the LLM entirely
+    else:
+        params = None
+        sql_query = get_sql_from_codex(user_query, context_hash)  # Generate SQL
+        is_safe, _ = validate_sql_query(sql_query)
+        if not is_safe:
+            raise ValueError("Keywords or characters detected that could trigger an attack")
 
     try:
-        # Execute SQL Query
-        cursor = conn.cursor()
-        result, df = execute_sql_query(cursor, sql_query)
-
-        response_with_results = openai.ChatCompletion.create(
-            model="gpt-4",
+        # Execute the SQL query while the preamble call is in flight, so the
+        # two waits overlap instead of running back to back.
+        preamble_future = get_executor().submit(generate_thinking_preamble, user_query)
+        cursor = get_cursor(conn)
+        df = execute_sql_query(cursor, sql_query, params)
+        try:
+            st.write(preamble_future.result())
+        except Exception:
+            pass  # the status line is cosmetic; never fail the answer over it
+
+        response_stream = openai.ChatCompletion.create(
+            model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": context},
+                system_message,
                 {"role": "user", "content": user_query},
-                {"role": "assistant", "content": f"Results: {result}"}
-            ]
+                {"role": "assistant", "content": f"Results: {json.dumps(summarize_for_llm(df), default=str)}"}
+            ],
+            temperature=0.2,
+            max_tokens=300,
+            stream=True,
+            headers={"prompt-cache-key": "jarvis-v1"}
         )
 
-        interpretation = response_with_results['choices'][0]['message']['content']
-
-        # Display results in Streamlit
+        # Display results in Streamlit, streaming the explanation token by
+        # token so the user sees output at first-token latency.
         with st.expander("Display SQL", expanded=False):
             st.write("SQL Query:", sql_query)
-        st.write("Explanation:", interpretation)
+        st.write("Explanation:")
+        st.write_stream(chunk['choices'][0]['delta'].get('content', '') for chunk in response_stream)
         st.write("Results:")
-        st.dataframe(df)
+        render_results(df)
 
     except Exception as e:
-        close_db_connection(conn, cursor=None)
+        conn.rollback()
         st.write("An error occurred:", str(e))
 
 
@@ -166,16 +702,18 @@ if __name__ == "__main__":
 
     st.title("Jarvis")
     st.subheader("Empowering your superhero employees to run before they can walk")  # Added subtitle
-    conn = get_db_connection()
-
-    user_query = st.text_input("Enter your question: What information do you seek from our DB today?",
-                               key="chat_input")
-    if user_query:
-        display_message("user", user_query)
-        call_chatbot(user_query, conn)
+    pool = get_db_connection()
+    conn = pool.getconn()
 
-    user_sql = st.text_input("Don't need Jarvis? Run your own SQL here-", key="sql_input")
-    if user_sql:
-        run_user_sql(user_sql, conn)
-
-    close_db_connection(conn, cursor=None)
+    try:
+        user_query = st.text_input("Enter your question: What information do you seek from our DB today?",
+                                   key="chat_input")
+        if user_query:
+            display_message("user", user_query)
+            call_chatbot(user_query, conn)
+
+        user_sql = st.text_input("Don't need Jarvis? Run your own SQL here-", key="sql_input")
+        if user_sql:
+            run_user_sql(user_sql, conn)
+    finally:
+        close_db_connection(conn)
@@ -0,0 +1,183 @@
+import json
+import os
+import re
+import threading
+
+import faiss
+import numpy as np
+
+EMBEDDING_DIM = 1536  # text-embedding-3-small
+
+YEAR_RE = re.compile(r'\b(?:19|20)\d{2}\b')
+
+
+def extract_slots(text, vocabularies):
+    """
+    Mines typed slot values (years plus enumerated schema values such as
+    market names) from free text.
+    :param text: The text to mine, either a user prompt or a SQL string.
+    :param vocabularies: Mapping of slot name to known values for that slot.
+    :return: Mapping of slot name to the value found, e.g. {'year': '2023', 'market': 'LATAM'}.
+    """
+    slots = {}
+    match = YEAR_RE.search(text)
+    if match:
+        slots['year'] = match.group()
+    for name, values in vocabularies.items():
+        for value in values:
+            if re.search(r'\b%s\b' % re.escape(value), text, re.IGNORECASE):
+                slots[name] = value
+                break
+    return slots
+
+
+def strip_slots(text, slots):
+    """
+    Replaces each slot value in the text with a {slot} placeholder, yielding
+    a template that can be re-filled with str.format.
+    :param text: The text to templatize.
+    :param slots: Mapping of slot name to value, as returned by extract_slots.
+    :return: The templatized text.
+    """
+    stripped = text
+    for name, value in slots.items():
+        stripped = re.sub(r'\b%s\b' % re.escape(value), '{%s}' % name, stripped, flags=re.IGNORECASE)
+    return stripped
+
+
+class SemanticCache:
+    """
+    Cosine-similarity cache of (user query -> SQL) pairs over a FAISS index.
+    Embeddings live in an in-memory IndexFlatIP; the queries and SQL strings
+    are persisted to a sidecar JSON so the cache survives process restarts.
+    Queries are templatized before embedding, so prompts that differ only in
+    slot values ("profit in LATAM 2023" vs "profit in USCA 2022") share one
+    entry whose SQL template is re-filled with the new values on a hit.
+    """
+
+    def __init__(self, threshold=0.92, store_path="semantic_cache.json", schema_identifiers=None,
+                 slot_vocabularies=None):
+        """
+        :param threshold: Minimum cosine similarity for a cache hit.
+        :param store_path: Path of the sidecar JSON holding cached entries.
+        :param schema_identifiers: Iterable of table/column names used for the
+            lexical consistency check on hits.
+        :param slot_vocabularies: Mapping of slot name to known values,
+            passed to extract_slots when templatizing queries.
+        """
+        self.threshold = threshold
+        self.store_path = store_path
+        self.schema_identifiers = set(schema_identifiers or [])
+        self.slot_vocabularies = dict(slot_vocabularies or {})
+        self.index = faiss.IndexFlatIP(EMBEDDING_DIM)
+        self.entries = []
+        # One instance is shared across all Streamlit session threads, so
+        # index/entries/sidecar mutations must not interleave.
+        self._lock = threading.Lock()
+        self._load()
+
+    def strip(self, user_query):
+        """
+        Templatizes a query for embedding, so slot-value differences don't
+        perturb the vector.
+        :param user_query: The user query string.
+        :return: The query with slot values replaced by placeholders.
+        """
+        return strip_slots(user_query, extract_slots(user_query, self.slot_vocabularies))
+
+    def lookup(self, user_query, embedding):
+        """
+        Returns the cached SQL for the most similar prior query, or None.
+        If the hit's slot values differ from the new query's, the stored SQL
+        template is re-filled with the new values; callers must still
+        revalidate the returned SQL.
+        :param user_query: The new user query string.
+        :param embedding: Embedding vector of the templatized query (see strip).
+        :return: The cached (or re-filled) SQL string on a hit, otherwise None.
+        """
+        with self._lock:
+            if self.index.ntotal == 0:
+                return None
+
+            vector = self._normalize(embedding)
+            scores, ids = self.index.search(vector, 1)
+            if scores[0][0] < self.threshold:
+                return None
+
+            entry = self.entries[ids[0][0]]
+        if not self._is_consistent(user_query, entry):
+            return None
+
+        slots = extract_slots(user_query, self.slot_vocabularies)
+        entry_slots = entry.get('slots', {})
+        if slots == entry_slots:
+            return entry['sql']
+        # Refill only when the slot names line up exactly; a superset query
+        # ("profit in LATAM 2023" vs cached "profit in 2023") carries a
+        # constraint the template has no placeholder for.
+        if set(entry_slots) == set(slots) and entry.get('template'):
+            try:
+                return entry['template'].format(**slots)
+            except (KeyError, IndexError, ValueError):
+                return None
+        return None
+
+    def add(self, user_query, embedding, sql):
+        """
+        Stores a new (query -> SQL) pair and appends it to the sidecar JSON.
+        The SQL is also templatized against the query's slot values so later
+        lookups can re-fill it for structurally identical questions.
+        :param user_query: The user query string.
+        :param embedding: Embedding vector of the templatized query (see strip).
+        :param sql: The SQL generated for the query.
+        """
+        slots = extract_slots(user_query, self.slot_vocabularies)
+        with self._lock:
+            self.index.add(self._normalize(embedding))
+            self.entries.append({
+                'query': user_query,
+                'sql': sql,
+                'slots': slots,
+                'template': strip_slots(sql, slots),
+                'embedding': list(map(float, embedding)),
+            })
+            self._save()
+
+    def _is_consistent(self, new_query, entry):
+        """
+        Lexical guard against near-miss hits: every schema identifier the user
+        named explicitly in the cached query must also appear in the new one,
+        so e.g. a "by market" query never answers a "by region" one.
+        """
+        new_words = self._words(new_query)
+        cached_words = self._words(entry['query'])
+        sql_lower = entry['sql'].lower()
+        for identifier in self.schema_identifiers:
+            mentioned = self._words(identifier.replace('_', ' '))
+            if identifier.lower() in sql_lower and mentioned & cached_words:
+                if not mentioned & new_words:
+                    return False
+        return True
+
+    @staticmethod
+    def _words(text):
+        return set(re.findall(r'[a-z0-9]+', text.lower()))
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype='float32').reshape(1, -1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _load(self):
+        if not os.path.exists(self.store_path):
+            return
+        with open(self.store_path) as f:
+            self.entries = json.load(f)
+        if self.entries:
+            vectors = np.vstack([self._normalize(e['embedding']) for e in self.entries])
+            self.index.add(vectors)
+
+    def _save(self):
+        with open(self.store_path, 'w') as f:
+            json.dump(self.entries, f)